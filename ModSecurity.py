@@ -1,20 +1,21 @@
 #!/usr/bin/env python3
-import subprocess
 import os
-import sys
-
-def run(cmd, cwd=None, env=None, use_sudo=False):
-    final_cmd = cmd
-    if use_sudo:
-        final_cmd = ["sudo"] + cmd
-    print(f"\n=== Running: {' '.join(final_cmd)} ===\n")
-    result = subprocess.run(final_cmd, cwd=cwd, env=env)
-    if result.returncode != 0:
-        print(f"❌ Command failed: {' '.join(final_cmd)}")
-        sys.exit(1)
+
+try:
+    from command_runner import CommandRunner
+except ImportError:
+    # Downloaded on its own: fetch the shared runner next to this script first
+    import urllib.request
+    urllib.request.urlretrieve(
+        "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/command_runner.py",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_runner.py"))
+    from command_runner import CommandRunner
+
+runner = CommandRunner("ModSecurity")
+run = runner.run_or_exit
 
 # 0. Install build dependencies
-print("=== [0] Installing build dependencies ===")
+runner.begin_step("[0] Installing build dependencies", timeout=1800)
 run([
     "apt-get", "update"
 ], use_sudo=True)
@@ -31,15 +32,18 @@ run([
 ], use_sudo=True)
 
 # 1. Clone ModSecurity
+runner.begin_step("[1] Cloning ModSecurity", timeout=600)
 run(["git", "clone", "https://github.com/SpiderLabs/ModSecurity"], cwd=os.path.expanduser("~"))
 
 modsec_dir = os.path.join(os.path.expanduser("~"), "ModSecurity")
 
 # 2. Init and update submodules
+runner.begin_step("[2] Updating submodules", timeout=600)
 run(["git", "submodule", "init"], cwd=modsec_dir)
 run(["git", "submodule", "update"], cwd=modsec_dir)
 
 # 3. Run build.sh
+runner.begin_step("[3] Building ModSecurity", timeout=3600)
 run(["./build.sh"], cwd=modsec_dir)
 
 # 4. Run ./configure
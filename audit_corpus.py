@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Turn ModSecurity audit log transactions into a replayable request corpus.
+
+Streams a Serial-format audit log, as written by libmodsecurity v3 (the
+version the installer builds, with `---id---B--` boundaries) or by
+ModSecurity v2 (`--id-B--`), and rebuilds each transaction's request from
+section B (request line and headers) and section C or I (request body). The
+status comes from section F and the matched rule ids from section H. Sensitive
+headers are masked or stripped. Repeats of the same normalized request are
+folded into one record with an occurrence count. The corpus can then be
+sampled down to a target size, stratified by the first matched rule id, so
+rare rules stay represented.
+
+    audit_corpus.py --log /var/log/modsec_audit.log --out requests.jsonl --size 500
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+from collections import defaultdict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Section boundary: ---3f2a9c1b---B-- (v3) or --3f2a9c1b-B-- (v2)
+BOUNDARY_PATTERN = re.compile(r'^-{2,3}([0-9A-Za-z]+)-{1,3}([A-Z])--$')
+RULE_ID_PATTERN = re.compile(r'\[id "(\d+)"\]')
+STATUS_PATTERN = re.compile(r'^HTTP/\S+ (\d{3})')
+
+SENSITIVE_HEADERS = {
+    "authorization",
+    "proxy-authorization",
+    "cookie",
+    "set-cookie",
+    "x-api-key",
+    "x-auth-token",
+    "x-csrf-token",
+    "x-xsrf-token",
+    "x-amz-security-token",
+}
+MASK = "***"
+
+# Headers that differ between otherwise identical requests
+VOLATILE_HEADERS = {"content-length", "connection", "x-request-id", "x-forwarded-for",
+                    "x-real-ip", "if-modified-since", "if-none-match", "date"}
+
+
+def read_transactions(log_path):
+    """Yield each transaction in the audit log as a dict of section letter to lines"""
+    with open(log_path, 'r', errors='ignore') as file:
+        current_id = None
+        sections = {}
+        section = None
+        for line in file:
+            line = line.rstrip("\r\n")
+            match = BOUNDARY_PATTERN.match(line)
+            if not match:
+                if section is not None:
+                    sections[section].append(line)
+                continue
+
+            transaction_id, section = match.groups()
+            if transaction_id != current_id:
+                # A transaction cut short by log rotation still yields its parts
+                if sections:
+                    yield sections
+                current_id = transaction_id
+                sections = {}
+            if section == "Z":
+                yield sections
+                current_id, sections, section = None, {}, None
+                continue
+            sections[section] = []
+        if sections:
+            yield sections
+
+
+def mask_header(name, value, strip):
+    """Return the value to keep for a header, or None to drop it"""
+    if name.lower() not in SENSITIVE_HEADERS:
+        return value
+    if strip:
+        return None
+    if name.lower() in ("cookie", "set-cookie"):
+        # Keep cookie names, which rules often match on, but not their values
+        pairs = [part.strip().split("=", 1)[0] for part in value.split(";") if part.strip()]
+        return "; ".join(f"{cookie}={MASK}" for cookie in pairs)
+    return MASK
+
+
+def build_record(sections, strip):
+    """Rebuild a request record from a transaction's sections, or None"""
+    request = sections.get("B")
+    if not request or not request[0].strip():
+        return None
+    parts = request[0].split(" ")
+    if len(parts) < 2:
+        return None
+    method, uri = parts[0], parts[1]
+    protocol = parts[2] if len(parts) > 2 else "HTTP/1.1"
+
+    headers = []
+    for line in request[1:]:
+        if not line.strip() or ":" not in line:
+            continue
+        name, value = line.split(":", 1)
+        value = mask_header(name.strip(), value.strip(), strip)
+        if value is not None:
+            headers.append([name.strip(), value])
+
+    body_lines = sections.get("C") or sections.get("I") or []
+    body = "\n".join(body_lines).strip("\n")
+
+    status = None
+    for line in sections.get("F", []):
+        match = STATUS_PATTERN.match(line)
+        if match:
+            status = int(match.group(1))
+            break
+
+    messages = "\n".join(sections.get("H", []))
+    rule_ids = list(dict.fromkeys(RULE_ID_PATTERN.findall(messages)))
+    header_line = (sections.get("A") or [""])[0]
+    timestamp = header_line[1:header_line.find("]")] if header_line.startswith("[") else None
+
+    return {
+        "method": method,
+        "uri": uri,
+        "protocol": protocol,
+        "headers": headers,
+        "body": body,
+        "status": status,
+        "blocked": "Access denied" in messages or status == 403,
+        "rule_ids": rule_ids,
+        "timestamp": timestamp,
+    }
+
+
+def request_hash(record):
+    """Hash a request so that trivially different repeats collide
+
+    Query parameters are sorted, the host is lowercased and volatile headers
+    are ignored; header order and case do not matter.
+    """
+    split = urlsplit(record["uri"])
+    query = urlencode(sorted(parse_qsl(split.query, keep_blank_values=True)))
+    headers = sorted(
+        (name.lower(), value if name.lower() != "host" else value.lower())
+        for name, value in record["headers"]
+        if name.lower() not in VOLATILE_HEADERS
+    )
+    key = json.dumps([record["method"].upper(), split.path, query, headers, record["body"].strip()])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def stratified_sample(records, size, seed):
+    """Sample records down to size, keeping each rule id's share of the corpus
+
+    Every rule id gets at least one record while there is room; the rest of
+    the budget is split in proportion to how many unique requests hit it.
+    With more rule ids than size, the rarest rule ids are the ones kept.
+    """
+    if size is None or len(records) <= size:
+        return records
+
+    strata = defaultdict(list)
+    for record in records:
+        strata[record["rule_ids"][0] if record["rule_ids"] else "none"].append(record)
+    # Smallest strata first, so rare rules win when there are more strata than slots
+    keys = sorted(strata, key=lambda k: (len(strata[k]), k))[:size]
+
+    quota = {key: 1 for key in keys}
+    remaining = size - len(keys)
+    if remaining:
+        spare = {key: len(strata[key]) - 1 for key in keys}
+        total = sum(spare.values())
+        shares = {key: remaining * spare[key] / total for key in keys}
+        for key in keys:
+            quota[key] += int(shares[key])
+        # Hand out what rounding down left over by largest remainder
+        leftover = size - sum(quota.values())
+        for key in sorted(keys, key=lambda k: shares[k] - int(shares[k]), reverse=True)[:leftover]:
+            quota[key] += 1
+
+    rng = random.Random(seed)
+    sample = []
+    for key in keys:
+        sample.extend(rng.sample(strata[key], min(quota[key], len(strata[key]))))
+    return sorted(sample, key=lambda record: record["first_seen"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", default="/var/log/modsec_audit.log")
+    parser.add_argument("--out", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--size", type=int, help="sample the corpus down to this many records")
+    parser.add_argument("--seed", type=int, default=0, help="seed for reproducible sampling")
+    parser.add_argument("--strip-sensitive", action="store_true",
+                        help="drop sensitive headers instead of masking their values")
+    parser.add_argument("--blocked-only", action="store_true",
+                        help="keep only transactions ModSecurity blocked")
+    args = parser.parse_args()
+
+    unique = {}
+    transactions = 0
+    try:
+        for number, sections in enumerate(read_transactions(args.log)):
+            record = build_record(sections, args.strip_sensitive)
+            if record is None or (args.blocked_only and not record["blocked"]):
+                continue
+            transactions += 1
+            key = request_hash(record)
+            if key in unique:
+                unique[key]["occurrences"] += 1
+                continue
+            record["id"] = key
+            record["occurrences"] = 1
+            record["first_seen"] = number
+            unique[key] = record
+    except FileNotFoundError:
+        print(f"File not found: {args.log}", file=sys.stderr)
+        sys.exit(1)
+
+    corpus = stratified_sample(list(unique.values()), args.size, args.seed)
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        for record in corpus:
+            record = {key: value for key, value in record.items() if key != "first_seen"}
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    rule_count = len({r["rule_ids"][0] if r["rule_ids"] else "none" for r in corpus})
+    print(f"✅ {transactions} transactions, {len(unique)} unique requests, "
+          f"{len(corpus)} written covering {rule_count} rule ids", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,13 @@
 #!/usr/bin/env python3
 
-import subprocess
 import os
 import time
 import shutil
 
-def run_command(command, shell=True):
-    """Run a shell command and return the result"""
-    try:
-        result = subprocess.run(command, shell=shell, check=True,
-                              capture_output=True, text=True)
-        return result.returncode == 0, result.stdout, result.stderr
-    except subprocess.CalledProcessError as e:
-        return False, e.stdout, e.stderr
+from command_runner import CommandRunner
+
+runner = CommandRunner("automate_waf_rules")
+run_command = runner.run_command
 
 def main():
     temp_dir = "/root/automate_waf_rules"
@@ -33,7 +28,8 @@ def main():
         # Clone the new ModSecurity CRS repository
         print("Cloning new ModSecurity CRS repository...")
         os.chdir(temp_dir)
-        success, stdout, stderr = run_command("git clone https://github.com/coreruleset/coreruleset modsecurity-crs")
+        success, stdout, stderr = run_command("git clone https://github.com/coreruleset/coreruleset modsecurity-crs",
+                                              timeout=600)
         if not success:
             print(f"Git clone failed: {stderr}")
             return
@@ -67,14 +63,14 @@ def main():
 
         # Test the OpenResty configuration
         print("Testing OpenResty configuration...")
-        success, stdout, stderr = run_command("openresty -t")
+        success, stdout, stderr = run_command("openresty -t", timeout=120)
 
         if success:
             print("OpenResty configuration test passed.")
 
             # Reload OpenResty configuration
             print("Reloading OpenResty configuration...")
-            reload_success, reload_stdout, reload_stderr = run_command("openresty -s reload")
+            reload_success, reload_stdout, reload_stderr = run_command("openresty -s reload", timeout=120)
 
             if reload_success:
                 print("OpenResty configuration reloaded successfully.")
@@ -1,16 +1,11 @@
 #!/usr/bin/env python3
 
 import os
-import subprocess
-
-def run_command(command, shell=True):
-    """Run a shell command and return the result"""
-    try:
-        result = subprocess.run(command, shell=shell, check=True,
-                              capture_output=True, text=True)
-        return result.returncode == 0, result.stdout, result.stderr
-    except subprocess.CalledProcessError as e:
-        return False, e.stdout, e.stderr
+
+from command_runner import CommandRunner
+
+runner = CommandRunner("clear_logs")
+run_command = runner.run_command
 
 def clear_log_file(log_path):
     """Clear a log file using the :> command"""
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""Shared command execution layer for the OpenResty automation scripts.
+
+Every command is recorded as a trace span (wall time, CPU time, exit status,
+output size) under the step that was active when it ran, every command runs
+under a timeout (capped by its step's time budget), and a JSON run report is
+written when the script exits.
+
+The report lands in $RUN_REPORT_DIR (default /var/log/openresty-automation)
+as <script>-<timestamp>-<pid>.json. $RUN_TIMEOUT overrides the default
+per-command timeout in seconds.
+"""
+
+import atexit
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+REPORT_DIR = os.environ.get("RUN_REPORT_DIR", "/var/log/openresty-automation")
+DEFAULT_TIMEOUT = float(os.environ.get("RUN_TIMEOUT", "1800"))
+
+# Seconds between SIGTERM and SIGKILL when a command overruns its timeout
+KILL_GRACE = 10
+
+CommandResult = namedtuple("CommandResult", ["returncode", "stdout", "stderr", "timed_out"])
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _exit_code(status):
+    """Convert a raw wait status into a subprocess-style return code"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _kill_group(pgid, sig):
+    """Signal a command's whole process group, ignoring one that already exited"""
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _pump(source, chunks, echo):
+    """Drain a pipe into chunks, optionally echoing it to another stream"""
+    while True:
+        data = os.read(source.fileno(), 65536)
+        if not data:
+            break
+        chunks.append(data)
+        if echo is not None:
+            echo.buffer.write(data)
+            echo.buffer.flush()
+    source.close()
+
+
+class CommandRunner:
+    """Run commands as timed spans and report them as JSON on exit"""
+
+    def __init__(self, name, report_dir=REPORT_DIR, default_timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.report_dir = report_dir
+        self.default_timeout = default_timeout
+        self.spans = []
+        self.started_at = _utc_now()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._step = None
+        self._written = False
+        atexit.register(self.write_report)
+
+    def _new_span(self, kind, name, parent_id):
+        with self._lock:
+            span = {
+                "id": len(self.spans) + 1,
+                "parent_id": parent_id,
+                "kind": kind,
+                "name": name,
+                "started_at": _utc_now(),
+            }
+            self.spans.append(span)
+        return span
+
+    def begin_step(self, name, timeout=None):
+        """Close the current step and open a new one
+
+        Commands run until the next begin_step() are recorded under this step.
+        A step timeout is a budget for the whole step: each command gets at
+        most the time left in it, even when it asks for a longer timeout.
+        """
+        self.end_step()
+        print(f"=== {name} ===")
+        span = self._new_span("step", name, None)
+        span["timeout"] = timeout
+        span["_start"] = time.monotonic()
+        self._step = span
+
+    def end_step(self):
+        """Close the current step, if any"""
+        step = self._step
+        if step is None:
+            return
+        step["wall_time"] = round(time.monotonic() - step.pop("_start"), 3)
+        children = [s for s in self.spans if s["parent_id"] == step["id"]]
+        step["cpu_time"] = round(sum(s.get("cpu_time", 0.0) for s in children), 3)
+        step["status"] = "ok" if all(s.get("returncode") == 0 for s in children) else "failed"
+        self._step = None
+
+    def run(self, cmd, cwd=None, env=None, shell=False, use_sudo=False,
+            capture_output=True, timeout=None, name=None):
+        """Run a command and return a CommandResult
+
+        With capture_output=False the command's stdout and stderr are streamed
+        to ours as they arrive (and still counted separately), and
+        stdout/stderr are returned empty.
+        """
+        if use_sudo:
+            cmd = f"sudo {cmd}" if isinstance(cmd, str) else ["sudo"] + cmd
+        display = cmd if isinstance(cmd, str) else " ".join(cmd)
+        step = self._step
+        if step and step["timeout"]:
+            left = step["timeout"] - (time.monotonic() - step["_start"])
+            timeout = round(max(0.0, left if timeout is None else min(timeout, left)), 1)
+        elif timeout is None:
+            timeout = self.default_timeout
+
+        span = self._new_span("command", name or display, step["id"] if step else None)
+        # Defaults stand until the command finishes, so a span cut short by an
+        # interrupt still reports as an unfinished, failed command
+        span.update(cmd=display, cwd=cwd, timeout=timeout, wall_time=None,
+                    cpu_user=0.0, cpu_system=0.0, cpu_time=0.0, returncode=None,
+                    timed_out=False, stdout_bytes=0, stderr_bytes=0)
+
+        start = time.monotonic()
+        try:
+            proc = subprocess.Popen(
+                cmd, cwd=cwd, env=env, shell=shell,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                # Own process group, so a timeout also reaches pipelines and
+                # helpers (git's transport, make's jobs) the command starts
+                start_new_session=True,
+            )
+        except OSError as e:
+            span.update(wall_time=round(time.monotonic() - start, 3), returncode=127, error=str(e))
+            print(f"❌ Could not start {display}: {e}")
+            return CommandResult(127, "", str(e), False)
+        out_chunks, err_chunks = [], []
+        pumps = [
+            threading.Thread(target=_pump, daemon=True,
+                             args=(proc.stdout, out_chunks, None if capture_output else sys.stdout)),
+            threading.Thread(target=_pump, daemon=True,
+                             args=(proc.stderr, err_chunks, None if capture_output else sys.stderr)),
+        ]
+        for pump in pumps:
+            pump.start()
+
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            _kill_group(proc.pid, signal.SIGTERM)
+            killer = threading.Timer(KILL_GRACE, _kill_group, args=(proc.pid, signal.SIGKILL))
+            killer.daemon = True
+            killer.start()
+
+        watchdog = threading.Timer(timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            # wait4() gives us the CPU usage of this child alone, which stays
+            # correct when several commands run concurrently from threads
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = _exit_code(status)
+        finally:
+            watchdog.cancel()
+            if proc.returncode is None:
+                # Interrupted (e.g. Ctrl-C): don't leave the command running
+                _kill_group(proc.pid, signal.SIGKILL)
+                proc.wait()
+                span["wall_time"] = round(time.monotonic() - start, 3)
+                span["error"] = "interrupted"
+        if timed_out.is_set():
+            # The leader is gone; make sure nothing it started outlives it
+            _kill_group(proc.pid, signal.SIGKILL)
+        for pump in pumps:
+            pump.join(KILL_GRACE if timed_out.is_set() else None)
+
+        stdout = b"".join(out_chunks)
+        stderr = b"".join(err_chunks)
+        span["wall_time"] = round(time.monotonic() - start, 3)
+        span["cpu_user"] = round(usage.ru_utime, 3)
+        span["cpu_system"] = round(usage.ru_stime, 3)
+        span["cpu_time"] = round(usage.ru_utime + usage.ru_stime, 3)
+        span["returncode"] = proc.returncode
+        span["timed_out"] = timed_out.is_set()
+        span["stdout_bytes"] = len(stdout)
+        span["stderr_bytes"] = len(stderr)
+
+        if timed_out.is_set():
+            print(f"⏱️  Timed out after {timeout}s: {display}")
+        if not capture_output:
+            return CommandResult(proc.returncode, "", "", timed_out.is_set())
+        return CommandResult(
+            proc.returncode,
+            stdout.decode(errors="replace"),
+            stderr.decode(errors="replace"),
+            timed_out.is_set(),
+        )
+
+    def run_command(self, command, shell=True, use_sudo=False, cwd=None, timeout=None):
+        """Run a command and return (success, stdout, stderr)"""
+        result = self.run(command, cwd=cwd, shell=shell, use_sudo=use_sudo, timeout=timeout)
+        stderr = result.stderr
+        if result.timed_out:
+            stderr += "\nCommand timed out"
+        return result.returncode == 0, result.stdout, stderr
+
+    def run_or_exit(self, cmd, cwd=None, env=None, use_sudo=False, capture_output=False, timeout=None):
+        """Run a command and exit the script if it fails
+
+        Returns the command's stdout when capture_output is set.
+        """
+        display = " ".join(["sudo"] + cmd if use_sudo else cmd)
+        print(f"\n=== Running: {display} ===\n")
+        result = self.run(cmd, cwd=cwd, env=env, use_sudo=use_sudo,
+                          capture_output=capture_output, timeout=timeout)
+        if result.returncode != 0:
+            print(f"❌ Command failed: {display}")
+            if capture_output:
+                print(result.stdout)
+                print(result.stderr)
+            sys.exit(1)
+        if capture_output:
+            return result.stdout
+
+    def report(self):
+        """Return the run report as a dict"""
+        self.end_step()
+        commands = [s for s in self.spans if s["kind"] == "command"]
+        return {
+            "script": self.name,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "finished_at": _utc_now(),
+            "wall_time": round(time.monotonic() - self._start, 3),
+            "cpu_time": round(sum(s.get("cpu_time", 0.0) for s in commands), 3),
+            "commands": len(commands),
+            "failed": sum(1 for s in commands if s.get("returncode") != 0),
+            "timed_out": sum(1 for s in commands if s.get("timed_out")),
+            "spans": self.spans,
+        }
+
+    def write_report(self, path=None):
+        """Write the run report as JSON, returning its path or None
+
+        Nothing is written for a run that executed no commands.
+        """
+        if self._written or not self.spans:
+            return None
+        self._written = True
+        report = self.report()
+        if path is None:
+            # The pid keeps concurrent runs of one script from overwriting each other
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(self.report_dir, f"{self.name}-{stamp}-{os.getpid()}.json")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            print(f"⚠️  Could not write run report {path}: {e}")
+            return None
+        print(f"📊 Run report written to {path}")
+        return path
@@ -1,8 +1,11 @@
 import os
 import json
-from subprocess import run
 from datetime import datetime
 
+from command_runner import CommandRunner
+
+runner = CommandRunner("country_mmdb")
+
 def download_geolite_if_needed():
     print("=== [14] Checking GeoLite2 database ===")
 
@@ -10,7 +13,7 @@ def download_geolite_if_needed():
     api_url = "https://api.github.com/repos/P3TERX/GeoLite.mmdb/releases/latest"
 
     # Get latest release info
-    api_response = run(["curl", "-s", api_url], capture_output=True, text=True)
+    api_response = runner.run(["curl", "-s", api_url], timeout=120)
     if api_response.returncode != 0:
         print("❌ Failed to fetch release information")
         return False
@@ -51,9 +54,9 @@ def download_geolite_if_needed():
     mmdb_url = mmdb_asset.get("browser_download_url")
     print(f"📥 Downloading latest GeoLite2 database from: {mmdb_url}")
 
-    download_result = run([
+    download_result = runner.run([
         "wget", "-O", mmdb_path, mmdb_url
-    ], capture_output=True)
+    ], timeout=600)
 
     if download_result.returncode == 0:
         print("✅ GeoLite2-Country.mmdb updated successfully")
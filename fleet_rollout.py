@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+"""Roll CRS and GeoLite2 updates out to a fleet of OpenResty nodes.
+
+The controller builds the artifact once (one CRS clone and one GeoLite2
+download for the whole fleet), validates it, then pushes it to the nodes with
+bounded parallelism: canary nodes first, the rest in waves of --concurrency.
+Each node is health-checked after a soak period. Block rate and probe latency
+are compared with that node's own baseline. The first failure halts the
+rollout and every node updated so far is rolled back.
+
+The same script runs on the nodes (from /opt) for the apply, rollback and
+health subcommands.
+
+    fleet_rollout.py rollout --nodes nodes.txt --concurrency 5 --canaries 1
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from command_runner import CommandRunner
+from maintenance_scheduler import LOCK_FILE, recent_requests
+
+CRS_REPO = "https://github.com/coreruleset/coreruleset"
+GEOLITE_API = "https://api.github.com/repos/P3TERX/GeoLite.mmdb/releases/latest"
+MMDB_NAME = "GeoLite2-Country.mmdb"
+# Trailer every MaxMind DB file carries before its metadata section
+MMDB_METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+
+# Node paths, relative to the node's root so the local transport can sandbox them
+CRS_DIR = "usr/local/openresty/nginx/modsecurity-crs"
+MMDB_PATH = "etc/openresty/geoip/" + MMDB_NAME
+ACCESS_LOG = "usr/local/openresty/nginx/logs/access.log"
+ROLLOUT_DIR = "var/lib/openresty-rollout"
+# Root-owned drop directory for pushed artifacts, never a shared /tmp
+INCOMING_DIR = os.path.join(ROLLOUT_DIR, "incoming")
+# Tells maintenance_scheduler.py to leave CRS and GeoLite2 updates to us
+FLEET_MARKER = os.path.join(ROLLOUT_DIR, "fleet-managed")
+# A rollback waits this long for a running maintenance job to finish
+ROLLBACK_LOCK_WAIT = 600
+# Node-local tuning that survives a CRS update, as in automate_waf_rules.py
+LOCAL_CRS_FILES = [
+    "crs-setup.conf",
+    "rules/REQUEST-900-EXCLUSION-RULES-BEFORE-CRS.conf",
+]
+
+runner = CommandRunner("fleet_rollout")
+
+
+def node_path(root, relative):
+    return os.path.join(root, relative)
+
+
+def one_line(output):
+    """Join command output into one line, so it can be a failure reason"""
+    return " / ".join(line.strip() for line in output.splitlines() if line.strip())
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Artifact -----------------------------------------------------------------
+
+def build_artifact(out_dir):
+    """Fetch CRS and GeoLite2 once and pack them into a validated tarball"""
+    stage = tempfile.mkdtemp(prefix="rollout-build-")
+    try:
+        crs_dir = os.path.join(stage, "modsecurity-crs")
+        success, stdout, stderr = runner.run_command(
+            f"git clone --depth 1 {CRS_REPO} {shlex.quote(crs_dir)}", timeout=600)
+        if not success:
+            raise RuntimeError(f"Git clone failed: {stderr}")
+        success, crs_commit, stderr = runner.run_command(
+            f"git -C {shlex.quote(crs_dir)} rev-parse HEAD", timeout=60)
+        if not success or not crs_commit.strip():
+            raise RuntimeError(f"Could not read the CRS commit: {stderr}")
+        shutil.rmtree(os.path.join(crs_dir, ".git"))
+        for example in ["crs-setup.conf.example",
+                        "rules/REQUEST-900-EXCLUSION-RULES-BEFORE-CRS.conf.example"]:
+            example_path = os.path.join(crs_dir, example)
+            if os.path.exists(example_path):
+                os.remove(example_path)
+
+        result = runner.run(["curl", "-sf", GEOLITE_API], timeout=120)
+        if result.returncode != 0:
+            raise RuntimeError("Failed to fetch GeoLite2 release information")
+        mmdb_url = None
+        for asset in json.loads(result.stdout).get("assets", []):
+            if asset.get("name") == MMDB_NAME:
+                mmdb_url = asset.get("browser_download_url")
+                break
+        if not mmdb_url:
+            raise RuntimeError(f"Could not find {MMDB_NAME} in the latest release")
+        mmdb_path = os.path.join(stage, MMDB_NAME)
+        result = runner.run(["curl", "-sfL", "-o", mmdb_path, mmdb_url], timeout=600)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to download {MMDB_NAME}")
+
+        validate_artifact(stage)
+
+        manifest = {
+            "built_at": datetime.now().isoformat(),
+            "crs_commit": crs_commit.strip(),
+            "mmdb_url": mmdb_url,
+            "mmdb_sha256": sha256_file(mmdb_path),
+        }
+        with open(os.path.join(stage, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.makedirs(out_dir, exist_ok=True)
+        artifact = os.path.join(out_dir, f"rollout-{datetime.now():%Y%m%d-%H%M%S}.tar.gz")
+        with tarfile.open(artifact, "w:gz") as tar:
+            for name in ["manifest.json", "modsecurity-crs", MMDB_NAME]:
+                tar.add(os.path.join(stage, name), arcname=name)
+        print(f"📦 Built {artifact} (CRS {manifest['crs_commit'][:12]})")
+        return artifact
+    finally:
+        shutil.rmtree(stage, ignore_errors=True)
+
+
+def validate_artifact(stage):
+    """Reject an artifact with no rules or a truncated GeoLite2 database"""
+    rules_dir = os.path.join(stage, "modsecurity-crs", "rules")
+    rule_files = [n for n in os.listdir(rules_dir) if n.endswith(".conf")] if os.path.isdir(rules_dir) else []
+    if not rule_files:
+        raise RuntimeError("Artifact has no CRS rule files")
+
+    mmdb_path = os.path.join(stage, MMDB_NAME)
+    if not os.path.isfile(mmdb_path):
+        raise RuntimeError(f"Artifact has no {MMDB_NAME}")
+    with open(mmdb_path, "rb") as f:
+        f.seek(max(0, os.path.getsize(mmdb_path) - 128 * 1024))
+        if MMDB_METADATA_MARKER not in f.read():
+            raise RuntimeError(f"{MMDB_NAME} has no MaxMind metadata section")
+    print(f"✅ Artifact valid: {len(rule_files)} rule files, {MMDB_NAME} present")
+
+
+# --- Node side ----------------------------------------------------------------
+
+def extract_artifact(artifact, staging):
+    """Extract an artifact, refusing members that would land outside staging"""
+    with tarfile.open(artifact) as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(staging, filter="data")
+            return
+        # Pythons without extraction filters: allow only plain files and
+        # directories with relative paths that stay inside staging
+        for member in tar.getmembers():
+            parts = member.name.replace("\\", "/").split("/")
+            if os.path.isabs(member.name) or ".." in parts or not (member.isfile() or member.isdir()):
+                raise RuntimeError(f"Refusing unsafe artifact member: {member.name}")
+        tar.extractall(staging)
+
+
+def maintenance_lock(root, wait=0):
+    """Take the maintenance scheduler's lock, waiting up to wait seconds
+
+    Returns the open lock file, which holds the lock until it is closed, or
+    None if a maintenance job still holds it.
+    """
+    path = node_path(root, LOCK_FILE.lstrip("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock = open(path, "w")
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                lock.close()
+                return None
+            time.sleep(1)
+
+
+def apply_artifact(root, artifact, test_cmd, reload_cmd):
+    """Install an artifact on this node, keeping the previous files for rollback
+
+    Fails without touching the node while a maintenance job holds the lock.
+    An artifact pushed into the incoming directory is deleted afterwards.
+    """
+    incoming = os.path.realpath(node_path(root, INCOMING_DIR))
+    lock = None
+    try:
+        lock = maintenance_lock(root)
+        if lock is None:
+            print("❌ A maintenance job is running on this node, not applying the artifact",
+                  file=sys.stderr)
+            return False
+        return _apply_artifact(root, artifact, test_cmd, reload_cmd)
+    finally:
+        if lock is not None:
+            lock.close()
+        if os.path.dirname(os.path.realpath(artifact)) == incoming and os.path.exists(artifact):
+            os.remove(artifact)
+
+
+def _apply_artifact(root, artifact, test_cmd, reload_cmd):
+    crs_dir = node_path(root, CRS_DIR)
+    mmdb_path = node_path(root, MMDB_PATH)
+    backup_dir = node_path(root, os.path.join(ROLLOUT_DIR, "previous"))
+    staging = node_path(root, os.path.join(ROLLOUT_DIR, "staging"))
+
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    extract_artifact(artifact, staging)
+
+    new_crs = os.path.join(staging, "modsecurity-crs")
+    for name in LOCAL_CRS_FILES:
+        if os.path.exists(os.path.join(crs_dir, name)):
+            shutil.copy2(os.path.join(crs_dir, name), os.path.join(new_crs, name))
+
+    shutil.rmtree(backup_dir, ignore_errors=True)
+    os.makedirs(backup_dir)
+    if os.path.exists(crs_dir):
+        shutil.move(crs_dir, os.path.join(backup_dir, "modsecurity-crs"))
+    if os.path.exists(mmdb_path):
+        shutil.copy2(mmdb_path, os.path.join(backup_dir, MMDB_NAME))
+
+    try:
+        os.makedirs(os.path.dirname(crs_dir), exist_ok=True)
+        shutil.move(new_crs, crs_dir)
+        os.makedirs(os.path.dirname(mmdb_path), exist_ok=True)
+        shutil.copy2(os.path.join(staging, MMDB_NAME), mmdb_path + ".new")
+        os.replace(mmdb_path + ".new", mmdb_path)
+    except Exception:
+        # Don't leave the node half-updated; the controller won't roll it back
+        _rollback_node(root, reload_cmd)
+        raise
+    shutil.rmtree(staging, ignore_errors=True)
+
+    success, stdout, stderr = runner.run_command(test_cmd, timeout=120)
+    if not success:
+        print(f"❌ OpenResty configuration test failed: {one_line(stderr)}", file=sys.stderr)
+        _rollback_node(root, reload_cmd)
+        return False
+    success, stdout, stderr = runner.run_command(reload_cmd, timeout=120)
+    if not success:
+        print(f"❌ OpenResty reload failed: {one_line(stderr)}", file=sys.stderr)
+        _rollback_node(root, reload_cmd)
+        return False
+    with open(node_path(root, FLEET_MARKER), "w") as f:
+        f.write(datetime.now().isoformat() + "\n")
+    print("✅ Artifact applied and OpenResty reloaded")
+    return True
+
+
+def rollback_node(root, reload_cmd):
+    """Restore the files replaced by the last apply
+
+    Waits up to ROLLBACK_LOCK_WAIT seconds for a running maintenance job, so
+    the two never replace the same files at once.
+    """
+    lock = maintenance_lock(root, wait=ROLLBACK_LOCK_WAIT)
+    if lock is None:
+        print("❌ A maintenance job is still running on this node, not rolling back",
+              file=sys.stderr)
+        return False
+    with lock:
+        return _rollback_node(root, reload_cmd)
+
+
+def _rollback_node(root, reload_cmd):
+    crs_dir = node_path(root, CRS_DIR)
+    mmdb_path = node_path(root, MMDB_PATH)
+    backup_dir = node_path(root, os.path.join(ROLLOUT_DIR, "previous"))
+    if not os.path.isdir(backup_dir):
+        print("⚠️  No previous files to roll back to")
+        return True
+
+    if os.path.isdir(os.path.join(backup_dir, "modsecurity-crs")):
+        shutil.rmtree(crs_dir, ignore_errors=True)
+        shutil.move(os.path.join(backup_dir, "modsecurity-crs"), crs_dir)
+    if os.path.isfile(os.path.join(backup_dir, MMDB_NAME)):
+        os.replace(os.path.join(backup_dir, MMDB_NAME), mmdb_path)
+    shutil.rmtree(backup_dir, ignore_errors=True)
+
+    success, stdout, stderr = runner.run_command(reload_cmd, timeout=120)
+    if not success:
+        print(f"❌ OpenResty reload after rollback failed: {one_line(stderr)}", file=sys.stderr)
+        return False
+    print("↩️  Rolled back to the previous CRS and GeoLite2 files")
+    return True
+
+
+def node_health(root, window, probe_url, probes):
+    """Return this node's recent block rate and probe latency"""
+    requests = blocked = 0
+    for line in recent_requests(node_path(root, ACCESS_LOG), window):
+        requests += 1
+        # Combined log format: ... "GET / HTTP/1.1" 403 ...
+        if b'" 403 ' in line:
+            blocked += 1
+
+    latencies = []
+    for _ in range(probes if probe_url else 0):
+        start = time.monotonic()
+        try:
+            urllib.request.urlopen(probe_url, timeout=5).read()
+        except urllib.error.HTTPError:
+            pass  # Any HTTP response, blocked or not, is a live server
+        except OSError:
+            return {"healthy": False, "error": f"probe of {probe_url} failed"}
+        latencies.append(time.monotonic() - start)
+
+    return {
+        "healthy": True,
+        "requests": requests,
+        "block_rate": blocked / requests if requests else 0.0,
+        "latency": statistics.median(latencies) if latencies else None,
+    }
+
+
+# --- Transports ---------------------------------------------------------------
+
+class SSHTransport:
+    """Reach nodes over ssh/scp, running the copy of this script in /opt"""
+
+    def __init__(self, user="root", script="/opt/fleet_rollout.py"):
+        self.user = user
+        self.script = script
+
+    def _target(self, node):
+        return f"{self.user}@{node}" if self.user else node
+
+    def push(self, node, artifact):
+        incoming = "/" + INCOMING_DIR
+        result = runner.run(["ssh", "-o", "BatchMode=yes", self._target(node),
+                             f"mkdir -p {incoming} && chmod 700 {incoming}"], timeout=60)
+        if result.returncode != 0:
+            raise RuntimeError(f"Preparing {incoming} on {node} failed: {result.stderr.strip()}")
+        remote_path = f"{incoming}/{os.path.basename(artifact)}"
+        result = runner.run(["scp", "-q", "-o", "BatchMode=yes", artifact,
+                             f"{self._target(node)}:{remote_path}"], timeout=600)
+        if result.returncode != 0:
+            raise RuntimeError(f"scp to {node} failed: {result.stderr.strip()}")
+        return remote_path
+
+    def invoke(self, node, args):
+        remote = " ".join(shlex.quote(a) for a in ["/usr/bin/python3", self.script] + args)
+        return runner.run(["ssh", "-o", "BatchMode=yes", self._target(node), remote],
+                          timeout=900, name=f"{node}: {args[0]}")
+
+
+class LocalTransport:
+    """Treat each node as a directory under root, for tests and dry runs
+
+    OpenResty commands are replaced by `true` and latency probes are skipped.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def openresty_commands(self, node):
+        """Return the (test, reload) commands a node's apply and rollback use"""
+        return "true", "true"
+
+    def push(self, node, artifact):
+        incoming = os.path.join(self.root, node, INCOMING_DIR)
+        os.makedirs(incoming, mode=0o700, exist_ok=True)
+        return shutil.copy2(artifact, incoming)
+
+    def invoke(self, node, args):
+        node_args = ["--root", os.path.join(self.root, node)]
+        if args[0] in ("apply", "rollback"):
+            test_cmd, reload_cmd = self.openresty_commands(node)
+            node_args += ["--test-cmd", test_cmd, "--reload-cmd", reload_cmd]
+        if args[0] == "health":
+            node_args += ["--probe-url", ""]
+        return runner.run([sys.executable, os.path.abspath(__file__)] + args + node_args,
+                          timeout=900, name=f"{node}: {args[0]}")
+
+
+TRANSPORTS = {
+    "ssh": lambda args: SSHTransport(user=args.ssh_user),
+    "local": lambda args: LocalTransport(args.local_root),
+}
+
+
+# --- Controller ---------------------------------------------------------------
+
+def check_health(transport, node, window):
+    result = transport.invoke(node, ["health", "--window", str(window)])
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {"healthy": False, "error": result.stderr.strip() or "no health report"}
+    return json.loads(lines[-1])
+
+
+def health_regressed(baseline, current, args):
+    """Return why current health is worse than baseline, or None"""
+    if not current.get("healthy"):
+        return current.get("error", "health check failed")
+    if current["requests"] >= args.min_requests:
+        increase = current["block_rate"] - baseline.get("block_rate", 0.0)
+        if increase > args.max_block_rate_increase:
+            return (f"block rate rose from {baseline.get('block_rate', 0.0):.1%} "
+                    f"to {current['block_rate']:.1%}")
+    if baseline.get("latency") and current.get("latency"):
+        if current["latency"] > baseline["latency"] * args.max_latency_ratio + 0.05:
+            return (f"latency rose from {baseline['latency'] * 1000:.0f} ms "
+                    f"to {current['latency'] * 1000:.0f} ms")
+    return None
+
+
+def roll_node(transport, node, artifact, args):
+    """Update one node and verify it
+
+    Returns (applied, error): whether the node now runs the artifact and needs
+    a rollback if the rollout halts, and why it failed, or None.
+    """
+    applied = False
+    try:
+        baseline = check_health(transport, node, args.window)
+        remote_artifact = transport.push(node, artifact)
+        result = transport.invoke(node, ["apply", remote_artifact])
+        if result.returncode != 0:
+            # A failed apply restores the node's previous files itself. Its
+            # reason is the last line on stderr; stdout ends with the run report.
+            output = (result.stderr.strip() or result.stdout.strip()).splitlines()
+            return False, f"apply failed: {output[-1] if output else result.returncode}"
+        applied = True
+        time.sleep(args.soak)
+        return True, health_regressed(baseline, check_health(transport, node, args.window), args)
+    except Exception as e:
+        # Whatever went wrong, the rollout must reach its rollback step
+        return applied, f"{type(e).__name__}: {e}"
+
+
+def rollout(transport, nodes, artifact, args):
+    """Roll an artifact out canary-first, halting and rolling back on failure"""
+    rest = nodes[args.canaries:]
+    stages = [("canary", nodes[:args.canaries])]
+    stages += [(f"wave {i // args.concurrency + 1}", rest[i:i + args.concurrency])
+               for i in range(0, len(rest), args.concurrency)]
+
+    applied = []
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        for label, stage in stages:
+            if not stage:
+                continue
+            runner.begin_step(f"[{label}] {', '.join(stage)}")
+            outcomes = list(pool.map(lambda n: roll_node(transport, n, artifact, args), stage))
+            failed = {}
+            for node, (node_applied, error) in zip(stage, outcomes):
+                if node_applied:
+                    applied.append(node)
+                if error:
+                    failed[node] = error
+                print(f"{'❌' if error else '✅'} {node}: {error or 'healthy'}")
+            if failed:
+                runner.begin_step(f"[rollback] {len(applied)} node(s)")
+                print("🛑 Halting rollout")
+                results = pool.map(lambda n: transport.invoke(n, ["rollback"]).returncode, applied)
+                for node, returncode in zip(applied, results):
+                    print(f"{'↩️ ' if returncode == 0 else '❌'} {node}: "
+                          f"{'rolled back' if returncode == 0 else 'rollback failed'}")
+                return False
+    print(f"\n🎉 Rolled out to {len(nodes)} node(s)")
+    return True
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
+
+
+def read_nodes(path):
+    with open(path) as f:
+        return [line.split("#")[0].strip() for line in f if line.split("#")[0].strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="build and validate an artifact")
+    build.add_argument("--out", default="/var/lib/openresty-rollout/artifacts")
+
+    roll = sub.add_parser("rollout", help="roll an artifact out to the fleet")
+    roll.add_argument("--nodes", required=True, help="file with one node per line")
+    roll.add_argument("--artifact", help="existing artifact (default: build one)")
+    roll.add_argument("--out", default="/var/lib/openresty-rollout/artifacts")
+    roll.add_argument("--transport", choices=sorted(TRANSPORTS), default="ssh")
+    roll.add_argument("--ssh-user", default="root")
+    roll.add_argument("--local-root", help="node directories for the local transport")
+    roll.add_argument("--concurrency", type=positive_int, default=5)
+    roll.add_argument("--canaries", type=non_negative_int, default=1)
+    roll.add_argument("--soak", type=float, default=120, help="seconds before the health check")
+    roll.add_argument("--window", type=int, default=60, help="access log window for health checks")
+    roll.add_argument("--min-requests", type=int, default=50,
+                      help="requests needed before the block rate is judged")
+    roll.add_argument("--max-block-rate-increase", type=float, default=0.05)
+    roll.add_argument("--max-latency-ratio", type=float, default=1.5)
+
+    for name in ("apply", "rollback", "health"):
+        node = sub.add_parser(name, help=f"(node side) {name}")
+        node.add_argument("--root", default="/")
+        if name == "apply":
+            node.add_argument("artifact")
+        if name in ("apply", "rollback"):
+            node.add_argument("--test-cmd", default="openresty -t")
+            node.add_argument("--reload-cmd", default="openresty -s reload")
+        if name == "health":
+            node.add_argument("--window", type=int, default=60)
+            node.add_argument("--probe-url", default="http://127.0.0.1/")
+            node.add_argument("--probes", type=int, default=5)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        try:
+            build_artifact(args.out)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    elif args.command == "rollout":
+        if args.transport == "local" and not args.local_root:
+            parser.error("--local-root is required with --transport local")
+        nodes = read_nodes(args.nodes)
+        artifact = args.artifact
+        if not artifact:
+            runner.begin_step("[build] Building artifact")
+            try:
+                artifact = build_artifact(args.out)
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+        if not rollout(TRANSPORTS[args.transport](args), nodes, artifact, args):
+            sys.exit(1)
+    elif args.command == "apply":
+        if not apply_artifact(args.root, args.artifact, args.test_cmd, args.reload_cmd):
+            sys.exit(1)
+    elif args.command == "rollback":
+        if not rollback_node(args.root, args.reload_cmd):
+            sys.exit(1)
+    elif args.command == "health":
+        print(json.dumps(node_health(args.root, args.window, args.probe_url, args.probes)))
+
+
+if __name__ == "__main__":
+    main()
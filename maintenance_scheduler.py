@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import socket
+import sys
+from datetime import datetime, timedelta
+
+from command_runner import CommandRunner
+
+ACCESS_LOG = "/usr/local/openresty/nginx/logs/access.log"
+STATE_FILE = "/var/lib/openresty-maintenance/state.json"
+LOCK_FILE = "/run/lock/openresty-maintenance.lock"
+# Written by `fleet_rollout.py apply`; while it exists the fleet controller
+# owns CRS and GeoLite2 updates and this node must not fetch its own
+FLEET_MARKER = "/var/lib/openresty-rollout/fleet-managed"
+
+# Defer jobs while the node serves more than this many requests per second
+MAX_REQUEST_RATE = float(os.environ.get("MAINTENANCE_MAX_RPS", "20"))
+# Window of the access log used to measure the current request rate
+RATE_WINDOW = 60
+# Each node shifts every job by a stable offset within this many minutes
+JITTER_MINUTES = 60
+# A failed job is retried this often until its deadline
+RETRY_INTERVAL = timedelta(minutes=30)
+
+# Weekly jobs: weekday (Monday=0), start time (IST), script, timeout in
+# seconds, hours after the start time by which the job runs regardless of
+# load, and whether the fleet controller takes the job over.
+JOBS = [
+    {"name": "waf_rules", "weekday": 6, "at": "07:30",
+     "script": "/opt/automate_waf_rules.py", "timeout": 1800, "deadline_hours": 6,
+     "fleet_managed": True},
+    {"name": "geolite2", "weekday": 5, "at": "07:30",
+     "script": "/opt/country_mmdb.py", "timeout": 900, "deadline_hours": 6,
+     "fleet_managed": True},
+    {"name": "clear_logs", "weekday": 5, "at": "08:30",
+     "script": "/opt/clear_logs.py", "timeout": 600, "deadline_hours": 6,
+     "fleet_managed": False},
+]
+
+TIME_LOCAL_PATTERN = re.compile(rb'\[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})\]')
+
+runner = CommandRunner("maintenance_scheduler")
+
+
+def node_jitter(job_name):
+    """Return this node's stable offset for a job"""
+    key = f"{socket.gethostname()}:{job_name}".encode()
+    seconds = int(hashlib.sha256(key).hexdigest(), 16) % (JITTER_MINUTES * 60)
+    return timedelta(seconds=seconds)
+
+
+def scheduled_time(job, now):
+    """Return the most recent scheduled start of a job at or before now"""
+    hour, minute = map(int, job["at"].split(":"))
+    start = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    start -= timedelta(days=(now.weekday() - job["weekday"]) % 7)
+    start += node_jitter(job["name"])
+    if start > now:
+        start -= timedelta(days=7)
+    return start
+
+
+def recent_requests(log_path=ACCESS_LOG, window=RATE_WINDOW):
+    """Yield the access log lines written in the last window seconds, newest first
+
+    Reads the log backwards in blocks, so the cost depends on the traffic in
+    the window rather than on the size of the log.
+    """
+    try:
+        f = open(log_path, "rb")
+    except OSError:
+        return
+
+    with f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        newest = None
+        tail = b""
+        while position > 0:
+            size = min(65536, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + tail).split(b"\n")
+            # The first piece may be a partial line; keep it for the next block
+            tail = lines.pop(0) if position > 0 else b""
+            for line in reversed(lines):
+                match = TIME_LOCAL_PATTERN.search(line)
+                if not match:
+                    continue
+                stamp = datetime.strptime(match.group(1).decode(), "%d/%b/%Y:%H:%M:%S %z")
+                if newest is None:
+                    newest = stamp
+                    # An idle log whose last entry is old means no traffic now
+                    if datetime.now(stamp.tzinfo) - stamp > timedelta(seconds=window):
+                        return
+                if (newest - stamp).total_seconds() > window:
+                    return
+                yield line
+
+
+def request_rate(log_path=ACCESS_LOG, window=RATE_WINDOW):
+    """Return requests per second over the last window seconds of the access log"""
+    return sum(1 for _ in recent_requests(log_path, window)) / window
+
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    temp_path = STATE_FILE + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, STATE_FILE)
+
+
+def due_jobs(state, now, fleet_managed=False):
+    """Return (job, scheduled start) for every job that has not succeeded since its last start
+
+    A job that failed since its start is retried every RETRY_INTERVAL until
+    its deadline, then left for the next week. Jobs the fleet controller owns
+    are never due on a fleet-managed node.
+    """
+    due = []
+    for job in JOBS:
+        if fleet_managed and job["fleet_managed"]:
+            continue
+        start = scheduled_time(job, now)
+        entry = state.get(job["name"], {})
+        last_run = entry.get("last_run")
+        if last_run is not None and datetime.fromisoformat(last_run) >= start:
+            continue
+        last_attempt = entry.get("last_attempt")
+        if last_attempt is not None and datetime.fromisoformat(last_attempt) >= start:
+            deadline = start + timedelta(hours=job["deadline_hours"])
+            if now >= deadline or now - datetime.fromisoformat(last_attempt) < RETRY_INTERVAL:
+                continue
+        due.append((job, start))
+    return sorted(due, key=lambda item: item[1])
+
+
+def main():
+    """Run at most one due maintenance job, deferring it while traffic is high"""
+
+    os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+    lock = open(LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("⚠️  Another maintenance job is still running, skipping this tick")
+        return
+
+    now = datetime.now()
+    state = load_state()
+    # A freshly installed node already has current rules and GeoIP data, so
+    # new jobs first run at their next scheduled start
+    new_jobs = [job["name"] for job in JOBS if job["name"] not in state]
+    if new_jobs:
+        for name in new_jobs:
+            state[name] = {"last_run": now.isoformat()}
+        save_state(state)
+    due = due_jobs(state, now, fleet_managed=os.path.exists(FLEET_MARKER))
+    if not due:
+        return
+
+    job, start = due[0]
+    deadline = start + timedelta(hours=job["deadline_hours"])
+    rate = request_rate()
+    if rate > MAX_REQUEST_RATE and now < deadline:
+        print(f"⏸️  Deferring {job['name']}: {rate:.1f} req/s is above {MAX_REQUEST_RATE:.1f} req/s "
+              f"(runs regardless after {deadline:%Y-%m-%d %H:%M})")
+        return
+
+    print(f"=== Running {job['name']} (scheduled {start:%Y-%m-%d %H:%M}, {rate:.1f} req/s) ===")
+    result = runner.run([sys.executable, job["script"]], capture_output=False,
+                        timeout=job["timeout"], name=job["name"])
+
+    # last_run only moves on success, so a failed job stays due for retries
+    entry = state.setdefault(job["name"], {})
+    entry.update(
+        last_attempt=now.isoformat(),
+        returncode=result.returncode,
+        request_rate=round(rate, 2),
+        forced_by_deadline=rate > MAX_REQUEST_RATE,
+    )
+    if result.returncode == 0:
+        entry["last_run"] = now.isoformat()
+        entry["failures"] = 0
+    else:
+        entry["last_failure"] = now.isoformat()
+        entry["failures"] = entry.get("failures", 0) + 1
+    save_state(state)
+
+    if result.returncode == 0:
+        print(f"✅ {job['name']} finished")
+    elif now + RETRY_INTERVAL < deadline:
+        print(f"❌ {job['name']} failed with exit code {result.returncode}, "
+              f"retrying in {RETRY_INTERVAL.seconds // 60} minutes")
+    else:
+        print(f"❌ {job['name']} failed with exit code {result.returncode}, "
+              f"past its deadline so it waits for next week")
+
+
+if __name__ == "__main__":
+    main()
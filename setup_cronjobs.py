@@ -1,78 +1,83 @@
 #!/usr/bin/env python3
 
-import subprocess
 import os
 import tempfile
 
-def run_command(command, shell=True):
-    """Run a shell command and return the result"""
-    try:
-        result = subprocess.run(command, shell=shell, check=True,
-                              capture_output=True, text=True)
-        return result.returncode == 0, result.stdout, result.stderr
-    except subprocess.CalledProcessError as e:
-        return False, e.stdout, e.stderr
-
-def add_cronjobs():
-    """Add cronjobs for WAF rules, GeoLite2 database updates, and log clearing"""
-
-    # Define the cronjob entries
-    cronjobs = [
-        "# WAF Rules Update - Every Sunday at 7:30 AM IST",
-        "30 7 * * 0 /usr/bin/python3 /opt/automate_waf_rules.py",
-        "",
-        "# GeoLite2 Database Update - Every Saturday at 7:30 AM IST",
-        "30 7 * * 6 /usr/bin/python3 /opt/country_mmdb.py",
-        "",
-        "# Clear Logs - Every Saturday at 7:30 AM IST",
-        "30 7 * * 6 /usr/bin/python3 /opt/clear_logs.py",
-        ""
-    ]
-
-    print("Adding cronjobs...")
-
-    # Get current crontab
-    success, current_crontab, stderr = run_command("crontab -l")
-    if not success and "no crontab for" not in stderr:
-        print(f"Error reading current crontab: {stderr}")
-        return False
+from command_runner import CommandRunner
 
-    # If no crontab exists, start with empty
-    if not success:
-        current_crontab = ""
+runner = CommandRunner("setup_cronjobs")
+run_command = runner.run_command
+
+SYSTEMD_DIR = "/etc/systemd/system"
+TIMER_NAME = "openresty-maintenance"
 
-    # Check if our jobs already exist
-    if "/opt/automate_waf_rules.py" in current_crontab:
-        print("⚠️  WAF rules cronjob already exists")
-    if "/opt/country_mmdb.py" in current_crontab:
-        print("⚠️  GeoLite2 database cronjob already exists")
-    if "/opt/clear_logs.py" in current_crontab:
-        print("⚠️  Clear logs cronjob already exists")
+# The scheduler decides on each tick whether a job is due, so the timer only
+# needs to fire often enough to honour the per-node jitter and load checks
+SERVICE_UNIT = """[Unit]
+Description=OpenResty WAF maintenance scheduler
 
-    # Add new cronjobs if they don't exist
-    new_crontab = current_crontab
+[Service]
+Type=oneshot
+ExecStart=/usr/bin/python3 /opt/maintenance_scheduler.py
+Nice=10
+IOSchedulingClass=idle
+"""
 
-    if "/opt/automate_waf_rules.py" not in current_crontab:
-        new_crontab += "\n" + cronjobs[0] + "\n" + cronjobs[1] + "\n"
-        print("✅ Added WAF rules update cronjob")
+TIMER_UNIT = """[Unit]
+Description=Run the OpenResty WAF maintenance scheduler every 5 minutes
 
-    if "/opt/country_mmdb.py" not in current_crontab:
-        new_crontab += "\n" + cronjobs[3] + "\n" + cronjobs[4] + "\n"
-        print("✅ Added GeoLite2 database update cronjob")
+[Timer]
+OnCalendar=*:0/5
+RandomizedDelaySec=60
+Persistent=true
 
-    if "/opt/clear_logs.py" not in current_crontab:
-        new_crontab += "\n" + cronjobs[6] + "\n" + cronjobs[7] + "\n"
-        print("✅ Added clear logs cronjob")
+[Install]
+WantedBy=timers.target
+"""
+
+# Scripts that used to be scheduled directly from cron
+LEGACY_SCRIPTS = [
+    "/opt/automate_waf_rules.py",
+    "/opt/country_mmdb.py",
+    "/opt/clear_logs.py",
+]
+
+def remove_legacy_cronjobs():
+    """Remove the fixed-time cronjobs now handled by the maintenance scheduler"""
+
+    print("Removing legacy cronjobs...")
+
+    success, current_crontab, stderr = run_command("crontab -l")
+    if not success:
+        if "no crontab for" in stderr:
+            print("✅ No crontab to clean up")
+            return True
+        print(f"Error reading current crontab: {stderr}")
+        return False
+
+    kept = []
+    removed = 0
+    for line in current_crontab.splitlines():
+        if any(script in line for script in LEGACY_SCRIPTS):
+            # Drop the comment line written above each legacy job as well
+            if kept and kept[-1].startswith("#"):
+                kept.pop()
+            removed += 1
+            continue
+        kept.append(line)
+
+    if not removed:
+        print("✅ No legacy cronjobs found")
+        return True
 
-    # Write the new crontab
     with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
-        temp_file.write(new_crontab.strip() + "\n")
+        temp_file.write("\n".join(kept).strip() + "\n")
         temp_file_path = temp_file.name
 
     try:
         success, stdout, stderr = run_command(f"crontab {temp_file_path}")
         if success:
-            print("✅ Crontab updated successfully")
+            print(f"✅ Removed {removed} legacy cronjob(s)")
         else:
             print(f"❌ Failed to update crontab: {stderr}")
             return False
@@ -81,55 +86,61 @@ def add_cronjobs():
 
     return True
 
-def restart_cron_service():
-    """Restart and check cron service status"""
-
-    print("\nRestarting cron service...")
-    success, stdout, stderr = run_command("systemctl restart cron")
-
-    if success:
-        print("✅ Cron service restarted successfully")
-    else:
-        print(f"❌ Failed to restart cron service: {stderr}")
-        return False
+def install_timer():
+    """Install and start the systemd timer that drives the maintenance scheduler"""
+
+    print("\nInstalling maintenance timer...")
+    units = {
+        f"{TIMER_NAME}.service": SERVICE_UNIT,
+        f"{TIMER_NAME}.timer": TIMER_UNIT,
+    }
+    for unit_name, content in units.items():
+        with open(os.path.join(SYSTEMD_DIR, unit_name), "w") as f:
+            f.write(content)
+        print(f"✅ Wrote {unit_name}")
+
+    for command in ["systemctl daemon-reload", f"systemctl enable --now {TIMER_NAME}.timer"]:
+        success, stdout, stderr = run_command(command)
+        if not success:
+            print(f"❌ {command} failed: {stderr}")
+            return False
 
-    print("\nChecking cron service status...")
-    success, stdout, stderr = run_command("systemctl status cron --no-pager")
+    print("\nChecking maintenance timer status...")
+    success, stdout, stderr = run_command(f"systemctl list-timers {TIMER_NAME}.timer --no-pager")
 
     if success:
-        print("✅ Cron service status:")
+        print("✅ Maintenance timer status:")
         print(stdout)
     else:
-        print(f"❌ Failed to get cron service status: {stderr}")
+        print(f"❌ Failed to get maintenance timer status: {stderr}")
         return False
 
     return True
 
 def main():
-    """Main function to add cronjobs and restart cron service"""
+    """Main function to replace the cronjobs with the maintenance timer"""
 
-    print("=== Setting up Cronjobs ===")
+    print("=== Setting up Maintenance Scheduler ===")
 
     # Check if running as root
     if os.geteuid() != 0:
         print("❌ This script must be run as root")
         return
 
-    # Add cronjobs
-    if not add_cronjobs():
-        print("❌ Failed to add cronjobs")
+    if not remove_legacy_cronjobs():
+        print("❌ Failed to remove legacy cronjobs")
         return
 
-    # Restart cron service
-    if not restart_cron_service():
-        print("❌ Failed to restart cron service")
+    if not install_timer():
+        print("❌ Failed to install maintenance timer")
         return
 
-    print("\n🎉 All done! Cronjobs have been set up successfully.")
-    print("\nScheduled jobs:")
-    print("• WAF Rules Update: Every Sunday at 7:30 AM IST")
-    print("• GeoLite2 Database Update: Every Saturday at 7:30 AM IST")
-    print("• Clear Logs: Every Saturday at 7:30 AM IST")
+    print("\n🎉 All done! The maintenance scheduler has been set up successfully.")
+    print("\nScheduled jobs (each node adds its own offset of up to 60 minutes):")
+    print("• WAF Rules Update: Every Sunday from 7:30 AM IST")
+    print("• GeoLite2 Database Update: Every Saturday from 7:30 AM IST")
+    print("• Clear Logs: Every Saturday from 8:30 AM IST")
+    print("\nJobs never overlap and are deferred while traffic is high, for at most 6 hours.")
 
 if __name__ == "__main__":
     main()
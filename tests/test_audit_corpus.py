@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import audit_corpus  # noqa: E402
+
+# ModSecurity v2 boundaries, a blocked request with credentials
+V2_LOG = """\
+--a1b2c3d4-A--
+[19/Oct/2026:10:00:00 +0530] YzA1 10.0.0.1 51514 10.0.0.2 80
+--a1b2c3d4-B--
+GET /search?b=2&a=1 HTTP/1.1
+Host: Example.com
+Cookie: session=abc123; theme=dark
+Authorization: Bearer secret-token
+User-Agent: curl/8.0
+
+--a1b2c3d4-F--
+HTTP/1.1 403 Forbidden
+
+--a1b2c3d4-H--
+Message: Access denied with code 403 (phase 2). [file "REQUEST-942.conf"] [id "942100"] [msg "SQL Injection"]
+
+--a1b2c3d4-Z--
+
+"""
+
+# libmodsecurity v3 boundaries: the same request with its query reordered,
+# then a POST whose body is in section C
+V3_LOG = """\
+---Xk3mP9qa---A--
+[19/Oct/2026:10:00:05 +0530] 1697690405 10.0.0.3 51515 10.0.0.2 80
+---Xk3mP9qa---B--
+GET /search?a=1&b=2 HTTP/1.1
+host: example.com
+user-agent: curl/8.0
+cookie: session=zzz999; theme=light
+Authorization: Bearer other-token
+X-Request-Id: 42
+
+---Xk3mP9qa---F--
+HTTP/1.1 403
+
+---Xk3mP9qa---H--
+ModSecurity: Access denied with code 403 (phase 2). [id "942100"] [msg "SQL Injection"]
+
+---Xk3mP9qa---Z--
+
+---Lq7vB2nc---A--
+[19/Oct/2026:10:00:09 +0530] 1697690409 10.0.0.4 51516 10.0.0.2 80
+---Lq7vB2nc---B--
+POST /login HTTP/1.1
+Host: example.com
+Content-Type: application/x-www-form-urlencoded
+
+---Lq7vB2nc---C--
+user=admin&pass=' OR 1=1--
+
+---Lq7vB2nc---F--
+HTTP/1.1 200
+
+---Lq7vB2nc---H--
+ModSecurity: Warning. Matched "Operator `Rx'" [id "920350"] [msg "Host header is a numeric IP address"]
+
+---Lq7vB2nc---Z--
+
+"""
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class AuditCorpusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def records(self, log, strip=False):
+        path = os.path.join(self.tmp.name, "audit.log")
+        write(path, log)
+        return [audit_corpus.build_record(sections, strip)
+                for sections in audit_corpus.read_transactions(path)]
+
+    def test_parses_v2_and_v3_logs(self):
+        (v2,) = self.records(V2_LOG)
+        self.assertEqual((v2["method"], v2["uri"], v2["status"]), ("GET", "/search?b=2&a=1", 403))
+        self.assertEqual(v2["rule_ids"], ["942100"])
+        self.assertTrue(v2["blocked"])
+        self.assertEqual(v2["timestamp"], "19/Oct/2026:10:00:00 +0530")
+
+        blocked, post = self.records(V3_LOG)
+        self.assertEqual(blocked["uri"], "/search?a=1&b=2")
+        self.assertEqual(blocked["rule_ids"], ["942100"])
+        self.assertEqual((post["method"], post["status"]), ("POST", 200))
+        self.assertEqual(post["body"], "user=admin&pass=' OR 1=1--")
+        self.assertEqual(post["rule_ids"], ["920350"])
+        self.assertFalse(post["blocked"])
+
+    def test_masks_or_strips_sensitive_headers(self):
+        (masked,) = self.records(V2_LOG)
+        headers = dict(masked["headers"])
+        self.assertEqual(headers["Cookie"], "session=***; theme=***")
+        self.assertEqual(headers["Authorization"], "***")
+        self.assertEqual(headers["User-Agent"], "curl/8.0")
+
+        (stripped,) = self.records(V2_LOG, strip=True)
+        names = [name for name, _ in stripped["headers"]]
+        self.assertEqual(names, ["Host", "User-Agent"])
+
+    def test_reordered_query_strings_share_a_hash(self):
+        (v2,) = self.records(V2_LOG)
+        v3, post = self.records(V3_LOG)
+        self.assertEqual(audit_corpus.request_hash(v2), audit_corpus.request_hash(v3))
+        self.assertNotEqual(audit_corpus.request_hash(v2), audit_corpus.request_hash(post))
+
+        v3["uri"] = "/search?a=1&b=3"
+        self.assertNotEqual(audit_corpus.request_hash(v2), audit_corpus.request_hash(v3))
+
+    def test_main_folds_repeats(self):
+        log = os.path.join(self.tmp.name, "audit.log")
+        out = os.path.join(self.tmp.name, "corpus.jsonl")
+        write(log, V2_LOG + V3_LOG)
+        argv = ["audit_corpus.py", "--log", log, "--out", out]
+        with mock.patch.object(sys, "argv", argv), mock.patch.object(sys, "stderr"):
+            audit_corpus.main()
+
+        with open(out) as f:
+            corpus = [json.loads(line) for line in f]
+        self.assertEqual([(r["uri"], r["occurrences"]) for r in corpus],
+                         [("/search?b=2&a=1", 2), ("/login", 1)])
+
+    def test_stratified_sample_size(self):
+        records = []
+        for rule_id, count in [("942100", 60), ("920350", 30), ("913100", 9), ("933160", 1)]:
+            for _ in range(count):
+                records.append({"rule_ids": [rule_id], "first_seen": len(records)})
+
+        sample = audit_corpus.stratified_sample(records, 20, seed=1)
+        self.assertEqual(len(sample), 20)
+        counts = {}
+        for record in sample:
+            counts[record["rule_ids"][0]] = counts.get(record["rule_ids"][0], 0) + 1
+        self.assertEqual(counts, {"942100": 11, "920350": 6, "913100": 2, "933160": 1})
+        self.assertEqual(sample, sorted(sample, key=lambda r: r["first_seen"]))
+        self.assertEqual(sample, audit_corpus.stratified_sample(records, 20, seed=1))
+
+        self.assertIs(audit_corpus.stratified_sample(records, None, seed=1), records)
+        self.assertIs(audit_corpus.stratified_sample(records, 500, seed=1), records)
+
+    def test_rare_rules_win_when_rule_ids_outnumber_size(self):
+        records = []
+        for rule_id, count in [("942100", 50), ("920350", 20), ("913100", 2), ("933160", 1)]:
+            for _ in range(count):
+                records.append({"rule_ids": [rule_id], "first_seen": len(records)})
+
+        sample = audit_corpus.stratified_sample(records, 2, seed=1)
+        self.assertEqual(sorted(r["rule_ids"][0] for r in sample), ["913100", "933160"])
+
+
+if __name__ == "__main__":
+    unittest.main()
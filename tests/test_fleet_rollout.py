@@ -0,0 +1,134 @@
+import argparse
+import fcntl
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REPORT_DIR = tempfile.mkdtemp(prefix="rollout-reports-")
+os.environ["RUN_REPORT_DIR"] = REPORT_DIR
+
+import fleet_rollout  # noqa: E402
+
+
+def tearDownModule():
+    # Write the run report now, so the atexit hook doesn't recreate the directory
+    fleet_rollout.runner.write_report()
+    shutil.rmtree(REPORT_DIR, ignore_errors=True)
+
+
+class FailingApplyTransport(fleet_rollout.LocalTransport):
+    """Local transport whose configuration test fails on some nodes"""
+
+    def __init__(self, root, failing):
+        super().__init__(root)
+        self.failing = failing
+
+    def openresty_commands(self, node):
+        return ("false" if node in self.failing else "true"), "true"
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class RolloutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        base = self.tmp.name
+
+        stage = os.path.join(base, "stage")
+        write(os.path.join(stage, "modsecurity-crs", "rules", "NEW.conf"), "new rules\n")
+        with open(os.path.join(stage, fleet_rollout.MMDB_NAME), "wb") as f:
+            f.write(b"new" + fleet_rollout.MMDB_METADATA_MARKER)
+        write(os.path.join(stage, "manifest.json"), "{}\n")
+        self.artifact = os.path.join(base, "artifact.tar.gz")
+        with tarfile.open(self.artifact, "w:gz") as tar:
+            for name in ["manifest.json", "modsecurity-crs", fleet_rollout.MMDB_NAME]:
+                tar.add(os.path.join(stage, name), arcname=name)
+
+        self.nodes_root = os.path.join(base, "nodes")
+        self.nodes = ["n1", "n2", "n3"]
+        for node in self.nodes:
+            write(self.node_file(node, fleet_rollout.CRS_DIR, "crs-setup.conf"), f"{node} setup\n")
+            write(self.node_file(node, fleet_rollout.CRS_DIR, "rules", "OLD.conf"), "old rules\n")
+            write(self.node_file(node, fleet_rollout.MMDB_PATH), "old mmdb\n")
+
+    def node_file(self, node, *parts):
+        return os.path.join(self.nodes_root, node, *parts)
+
+    def args(self):
+        return argparse.Namespace(concurrency=1, canaries=1, soak=0, window=60,
+                                  min_requests=50, max_block_rate_increase=0.05,
+                                  max_latency_ratio=1.5)
+
+    def test_failed_wave_rolls_back_canary(self):
+        transport = FailingApplyTransport(self.nodes_root, failing={"n2"})
+
+        ok = fleet_rollout.rollout(transport, self.nodes, self.artifact, self.args())
+
+        self.assertFalse(ok)
+        crs = self.node_file("n1", fleet_rollout.CRS_DIR)
+        self.assertEqual(read(os.path.join(crs, "rules", "OLD.conf")), "old rules\n")
+        self.assertFalse(os.path.exists(os.path.join(crs, "rules", "NEW.conf")))
+        self.assertEqual(read(os.path.join(crs, "crs-setup.conf")), "n1 setup\n")
+        self.assertEqual(read(self.node_file("n1", fleet_rollout.MMDB_PATH)), "old mmdb\n")
+        self.assertFalse(os.path.exists(self.node_file("n1", fleet_rollout.ROLLOUT_DIR, "previous")))
+        # The failing node restored itself and the halt kept n3 untouched
+        self.assertEqual(read(self.node_file("n2", fleet_rollout.MMDB_PATH)), "old mmdb\n")
+        self.assertFalse(os.path.exists(self.node_file("n3", fleet_rollout.ROLLOUT_DIR)))
+        self.assertEqual(os.listdir(self.node_file("n1", fleet_rollout.INCOMING_DIR)), [])
+
+    def test_successful_rollout_keeps_local_config(self):
+        transport = fleet_rollout.LocalTransport(self.nodes_root)
+
+        ok = fleet_rollout.rollout(transport, self.nodes, self.artifact, self.args())
+
+        self.assertTrue(ok)
+        for node in self.nodes:
+            crs = self.node_file(node, fleet_rollout.CRS_DIR)
+            self.assertEqual(read(os.path.join(crs, "rules", "NEW.conf")), "new rules\n")
+            self.assertEqual(read(os.path.join(crs, "crs-setup.conf")), f"{node} setup\n")
+            self.assertTrue(os.path.exists(self.node_file(node, fleet_rollout.FLEET_MARKER)))
+
+    def test_failed_apply_reports_the_node_side_reason(self):
+        transport = FailingApplyTransport(self.nodes_root, failing={"n1"})
+
+        applied, error = fleet_rollout.roll_node(transport, "n1", self.artifact, self.args())
+
+        self.assertFalse(applied)
+        self.assertTrue(error.startswith("apply failed: ❌ OpenResty configuration test failed"), error)
+
+    def test_apply_refuses_while_maintenance_runs(self):
+        root = os.path.join(self.nodes_root, "n1")
+        lock_path = os.path.join(root, fleet_rollout.LOCK_FILE.lstrip("/"))
+        os.makedirs(os.path.dirname(lock_path))
+        with open(lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            ok = fleet_rollout.apply_artifact(root, self.artifact, "true", "true")
+
+        self.assertFalse(ok)
+        crs = self.node_file("n1", fleet_rollout.CRS_DIR)
+        self.assertFalse(os.path.exists(os.path.join(crs, "rules", "NEW.conf")))
+        self.assertFalse(os.path.exists(self.node_file("n1", fleet_rollout.ROLLOUT_DIR, "previous")))
+
+        self.assertTrue(fleet_rollout.apply_artifact(root, self.artifact, "true", "true"))
+        self.assertEqual(read(os.path.join(crs, "rules", "NEW.conf")), "new rules\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import maintenance_scheduler  # noqa: E402
+
+# Saturday 2026-10-17; geolite2 starts Saturdays at 07:30, waf_rules Sundays
+SATURDAY = datetime(2026, 10, 17)
+
+
+def jobs_named(due):
+    return [job["name"] for job, _ in due]
+
+
+class JitterTest(unittest.TestCase):
+
+    def test_node_jitter_is_stable_and_bounded(self):
+        first = maintenance_scheduler.node_jitter("geolite2")
+        self.assertEqual(first, maintenance_scheduler.node_jitter("geolite2"))
+        self.assertGreaterEqual(first, timedelta(0))
+        self.assertLess(first, timedelta(minutes=maintenance_scheduler.JITTER_MINUTES))
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(maintenance_scheduler, "node_jitter",
+                                    return_value=timedelta(0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.geolite2 = next(j for j in maintenance_scheduler.JOBS if j["name"] == "geolite2")
+
+    def test_scheduled_time_is_latest_start_at_or_before_now(self):
+        start = maintenance_scheduler.scheduled_time(self.geolite2, SATURDAY.replace(hour=9))
+        self.assertEqual(start, SATURDAY.replace(hour=7, minute=30))
+
+        # Before Saturday's start the previous week's start is the latest one
+        start = maintenance_scheduler.scheduled_time(self.geolite2, SATURDAY.replace(hour=7))
+        self.assertEqual(start, SATURDAY.replace(hour=7, minute=30) - timedelta(days=7))
+
+        # Midweek
+        start = maintenance_scheduler.scheduled_time(self.geolite2, SATURDAY + timedelta(days=3))
+        self.assertEqual(start, SATURDAY.replace(hour=7, minute=30))
+
+    def test_jitter_shifts_the_start(self):
+        with mock.patch.object(maintenance_scheduler, "node_jitter",
+                               return_value=timedelta(minutes=40)):
+            start = maintenance_scheduler.scheduled_time(self.geolite2, SATURDAY.replace(hour=8))
+        self.assertEqual(start, SATURDAY.replace(hour=8, minute=10) - timedelta(days=7))
+
+    def test_due_jobs(self):
+        now = SATURDAY.replace(hour=9)
+        # Monday: after last Sunday's waf_rules start, before this Saturday's jobs
+        monday = (SATURDAY - timedelta(days=5)).isoformat()
+        state = {name: {"last_run": monday} for name in ("waf_rules", "geolite2", "clear_logs")}
+
+        self.assertEqual(jobs_named(maintenance_scheduler.due_jobs(state, now)),
+                         ["geolite2", "clear_logs"])
+
+        state["geolite2"]["last_run"] = SATURDAY.replace(hour=7, minute=45).isoformat()
+        self.assertEqual(jobs_named(maintenance_scheduler.due_jobs(state, now)), ["clear_logs"])
+
+    def test_fleet_managed_node_skips_crs_and_geolite2(self):
+        now = SATURDAY + timedelta(days=1, hours=9)
+        due = maintenance_scheduler.due_jobs({}, now, fleet_managed=True)
+        self.assertEqual(jobs_named(due), ["clear_logs"])
+        due = maintenance_scheduler.due_jobs({}, now, fleet_managed=False)
+        self.assertEqual(jobs_named(due), ["geolite2", "clear_logs", "waf_rules"])
+
+    def test_failed_job_retries_until_deadline(self):
+        start = SATURDAY.replace(hour=7, minute=30)
+        attempt = start + timedelta(minutes=5)
+        state = {
+            "geolite2": {"last_run": (start - timedelta(days=7)).isoformat(),
+                         "last_attempt": attempt.isoformat(), "returncode": 1},
+            "clear_logs": {"last_run": SATURDAY.replace(hour=9).isoformat()},
+            "waf_rules": {"last_run": SATURDAY.replace(hour=9).isoformat()},
+        }
+
+        def due_at(now):
+            return jobs_named(maintenance_scheduler.due_jobs(state, now))
+
+        self.assertEqual(due_at(attempt + timedelta(minutes=10)), [])
+        self.assertEqual(due_at(attempt + maintenance_scheduler.RETRY_INTERVAL), ["geolite2"])
+        deadline = start + timedelta(hours=self.geolite2["deadline_hours"])
+        state["geolite2"]["last_attempt"] = (deadline - timedelta(minutes=1)).isoformat()
+        self.assertEqual(due_at(deadline + maintenance_scheduler.RETRY_INTERVAL), [])
+
+
+class RequestRateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.log = os.path.join(self.tmp.name, "access.log")
+
+    def write_log(self, ages):
+        """Write one combined-format line per age in seconds, oldest first"""
+        now = datetime.now(timezone.utc).astimezone()
+        with open(self.log, "w") as f:
+            for age in sorted(ages, reverse=True):
+                stamp = (now - timedelta(seconds=age)).strftime("%d/%b/%Y:%H:%M:%S %z")
+                f.write(f'10.0.0.1 - - [{stamp}] "GET / HTTP/1.1" 200 12 "-" "curl"\n')
+
+    def test_counts_only_the_window(self):
+        # 120 recent requests plus 5000 old ones the reader must not reach
+        self.write_log([0] * 60 + [20] * 60 + [300] * 5000)
+        self.assertEqual(len(list(maintenance_scheduler.recent_requests(self.log, 60))), 120)
+        self.assertEqual(maintenance_scheduler.request_rate(self.log, 60), 2.0)
+
+    def test_idle_log_has_no_traffic(self):
+        self.write_log([600] * 100)
+        self.assertEqual(maintenance_scheduler.request_rate(self.log, 60), 0.0)
+
+    def test_missing_log_has_no_traffic(self):
+        self.assertEqual(maintenance_scheduler.request_rate(self.log + ".missing", 60), 0.0)
+
+    def test_partial_lines_across_blocks(self):
+        # Long lines force block boundaries to split them
+        now = datetime.now(timezone.utc).astimezone()
+        stamp = now.strftime("%d/%b/%Y:%H:%M:%S %z")
+        with open(self.log, "w") as f:
+            for _ in range(50):
+                f.write(f'10.0.0.1 - - [{stamp}] "GET /{"a" * 9000} HTTP/1.1" 200 1\n')
+        self.assertEqual(len(list(maintenance_scheduler.recent_requests(self.log, 60))), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
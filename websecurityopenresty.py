@@ -1,33 +1,30 @@
 #!/usr/bin/env python3
-import subprocess
 import os
 import sys
 import json
-import shutil
-
-def run(cmd, cwd=None, env=None, use_sudo=False, capture_output=False):
-    final_cmd = cmd
-    if use_sudo:
-        final_cmd = ["sudo"] + cmd
-    print(f"\n=== Running: {' '.join(final_cmd)} ===\n")
-    if capture_output:
-        result = subprocess.run(final_cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode != 0:
-            print(f"❌ Command failed: {' '.join(final_cmd)}")
-            print(result.stdout)
-            print(result.stderr)
-            sys.exit(1)
-        return result.stdout
-    else:
-        result = subprocess.run(final_cmd, cwd=cwd, env=env)
-        if result.returncode != 0:
-            print(f"❌ Command failed: {' '.join(final_cmd)}")
-            sys.exit(1)
+
+try:
+    from command_runner import CommandRunner
+except ImportError:
+    # Downloaded on its own: fetch the shared runner next to this script first
+    import urllib.request
+    urllib.request.urlretrieve(
+        "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/command_runner.py",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_runner.py"))
+    from command_runner import CommandRunner
+
+# Time budgets for whole steps; a stalled clone or download fails fast
+NETWORK_TIMEOUT = 600
+PACKAGE_TIMEOUT = 1800
+BUILD_TIMEOUT = 3600
+
+runner = CommandRunner("websecurityopenresty")
+run = runner.run_or_exit
 
 home = os.path.expanduser("~")
 
 # 0. Install ALL dependencies
-print("=== [0] Installing all dependencies ===")
+runner.begin_step("[0] Installing all dependencies", timeout=PACKAGE_TIMEOUT)
 run([
     "apt-get", "update"
 ], use_sudo=True)
@@ -41,8 +38,8 @@ run([
 ], use_sudo=True)
 
 # 1. Add OpenResty repo
-print("=== [1] Adding OpenResty repository ===")
-lsb_codename = os.popen('lsb_release -sc').read().strip()
+runner.begin_step("[1] Adding OpenResty repository", timeout=PACKAGE_TIMEOUT)
+lsb_codename = run(["lsb_release", "-sc"], capture_output=True).strip()
 run([
     "add-apt-repository", "-y",
     f"deb http://openresty.org/package/ubuntu {lsb_codename} main"
@@ -53,33 +50,33 @@ run([
 run(["apt-get", "update"], use_sudo=True)
 
 # 2. Install OpenResty
-print("=== [2] Installing OpenResty ===")
+runner.begin_step("[2] Installing OpenResty", timeout=PACKAGE_TIMEOUT)
 run(["apt-get", "install", "-y", "openresty"], use_sudo=True)
 run(["systemctl", "enable", "openresty"], use_sudo=True)
 run(["systemctl", "restart", "openresty"], use_sudo=True)
 run(["openresty", "-v"])
 
 # 3. Build ModSecurity
-print("=== [3] Building ModSecurity ===")
+runner.begin_step("[3] Building ModSecurity", timeout=BUILD_TIMEOUT)
 modsec_dir = os.path.join(home, "ModSecurity")
 if not os.path.isdir(modsec_dir):
-    run(["git", "clone", "https://github.com/SpiderLabs/ModSecurity"], cwd=home)
+    run(["git", "clone", "https://github.com/SpiderLabs/ModSecurity"], cwd=home, timeout=NETWORK_TIMEOUT)
 run(["git", "submodule", "init"], cwd=modsec_dir)
-run(["git", "submodule", "update"], cwd=modsec_dir)
+run(["git", "submodule", "update"], cwd=modsec_dir, timeout=NETWORK_TIMEOUT)
 run(["./build.sh"], cwd=modsec_dir)
 run(["./configure"], cwd=modsec_dir)
 run(["make"], cwd=modsec_dir)
 run(["make", "install"], cwd=modsec_dir, use_sudo=True)
 
 # 4. Clone ModSecurity NGINX connector
-print("=== [4] Cloning ModSecurity NGINX connector ===")
+runner.begin_step("[4] Cloning ModSecurity NGINX connector", timeout=NETWORK_TIMEOUT)
 modsec_nginx_dir = os.path.join(home, "ModSecurity-nginx")
 if not os.path.isdir(modsec_nginx_dir):
     run(["git", "clone", "--depth", "1", "https://github.com/SpiderLabs/ModSecurity-nginx.git"], cwd=home)
 
 # 5. Download OpenResty source to build dynamic module
-print("=== [5] Downloading OpenResty source ===")
-openresty_ver = os.popen("openresty -v 2>&1").read().split('/')[1].strip()
+runner.begin_step("[5] Downloading OpenResty source", timeout=NETWORK_TIMEOUT)
+openresty_ver = runner.run("openresty -v 2>&1", shell=True).stdout.split('/')[-1].strip()
 if not openresty_ver:
     print("❌ Could not detect OpenResty version. Is OpenResty installed?")
     sys.exit(1)
@@ -92,13 +89,13 @@ if not os.path.isdir(openresty_src_dir):
     run(["tar", "-zxvf", f"openresty-{openresty_ver}.tar.gz"], cwd=home)
 
 # 6. Build dynamic ModSecurity module
-print("=== [6] Building dynamic ModSecurity module ===")
+runner.begin_step("[6] Building dynamic ModSecurity module", timeout=BUILD_TIMEOUT)
 run(["./configure", "--with-compat", f"--add-dynamic-module={modsec_nginx_dir}"], cwd=openresty_src_dir)
 run(["make"], cwd=openresty_src_dir)
 run(["make", "install"], cwd=openresty_src_dir, use_sudo=True)
 
 # 7. Download and configure OWASP CRS
-print("=== [7] Downloading OWASP Core Rule Set ===")
+runner.begin_step("[7] Downloading OWASP Core Rule Set", timeout=NETWORK_TIMEOUT)
 crs_dir = os.path.join(home, "modsecurity-crs")
 if not os.path.isdir(crs_dir):
     run(["git", "clone", "https://github.com/coreruleset/coreruleset", "modsecurity-crs"], cwd=home)
@@ -111,7 +108,7 @@ if not os.path.isdir(crs_target_dir):
     run(["mv", crs_dir, crs_target_dir], use_sudo=True)
 
 # 8. Setup ModSecurity config files
-print("=== [8] Setting up ModSecurity configuration ===")
+runner.begin_step("[8] Setting up ModSecurity configuration")
 modsec_conf_dir = "/usr/local/openresty/nginx/modsec"
 run(["mkdir", "-p", modsec_conf_dir], use_sudo=True)
 run(["cp", os.path.join(modsec_dir, "unicode.mapping"), modsec_conf_dir], use_sudo=True)
@@ -120,7 +117,7 @@ if not os.path.isfile(modsec_conf_file):
     run(["cp", os.path.join(modsec_dir, "modsecurity.conf-recommended"), modsec_conf_file], use_sudo=True)
 
 # 9. Create main.conf
-print("=== [9] Creating main.conf ===")
+runner.begin_step("[9] Creating main.conf")
 main_conf = """
 Include /usr/local/openresty/nginx/modsec/modsecurity.conf
 Include /usr/local/openresty/nginx/modsecurity-crs/crs-setup.conf
@@ -131,7 +128,7 @@ with open("/tmp/main.conf", "w") as f:
 run(["mv", "/tmp/main.conf", f"{modsec_conf_dir}/main.conf"], use_sudo=True)
 
 # 10. Download and replace configuration files
-print("=== [10] Replacing default configuration files ===")
+runner.begin_step("[10] Replacing default configuration files", timeout=NETWORK_TIMEOUT)
 files_to_replace = [
     (f"{modsec_conf_dir}/modsecurity.conf", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/modsecurity.conf"),
     ("/usr/local/openresty/nginx/modsecurity-crs/crs-setup.conf", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/crs-setup.conf"),
@@ -141,22 +138,27 @@ files_to_replace = [
     ("/opt/automate_waf_rules.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/automate_waf_rules.py"),
     ("/opt/country_mmdb.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/country_mmdb.py"),
     ("/opt/setup_cronjobs.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/setup_cronjobs.py"),
+    ("/opt/command_runner.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/command_runner.py"),
+    ("/opt/maintenance_scheduler.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/maintenance_scheduler.py"),
+    ("/opt/fleet_rollout.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/fleet_rollout.py"),
     ("/opt/clear_logs.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/clear_logs.py"),
+    ("/root/command_runner.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/command_runner.py"),
     ("/root/delete_openresty_files.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/delete_openresty_files.py"),
     ("/var/log/400.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/400.py"),
     ("/var/log/403.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/403.py"),
     ("/var/log/alluri.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/alluri.py"),
+    ("/var/log/audit_corpus.py", "https://raw.githubusercontent.com/Jegansri/swgopenrestyautomation/main/audit_corpus.py"),
 ]
 for dest, url in files_to_replace:
     run(["rm", "-f", dest], use_sudo=True)
     run(["wget", "-O", dest, url], use_sudo=True)
 
 # 10b. Install MaxMindDB development library (required for GeoIP2 module)
-print("=== [10b] Installing MaxMindDB development library for GeoIP2 ===")
+runner.begin_step("[10b] Installing MaxMindDB development library for GeoIP2", timeout=PACKAGE_TIMEOUT)
 run(["apt-get", "install", "-y", "libmaxminddb-dev", "mmdb-bin"], use_sudo=True)
 
 # 11. Download ngx_http_geoip2_module
-print("=== [11] Downloading GeoIP2 module ===")
+runner.begin_step("[11] Downloading GeoIP2 module", timeout=NETWORK_TIMEOUT)
 geoip2_zip = os.path.join(home, "master.zip")
 geoip2_dir = os.path.join(home, "ngx_http_geoip2_module-master")
 if not os.path.isdir(geoip2_dir):
@@ -164,17 +166,17 @@ if not os.path.isdir(geoip2_dir):
     run(["unzip", "-o", "master.zip"], cwd=home)
 
 # 12. Build GeoIP2 dynamic module (uses openresty_src_dir from before)
-print("=== [12] Building GeoIP2 dynamic module ===")
+runner.begin_step("[12] Building GeoIP2 dynamic module", timeout=BUILD_TIMEOUT)
 run(["./configure", "--with-compat", f"--add-dynamic-module={geoip2_dir}"], cwd=openresty_src_dir)
 run(["make"], cwd=openresty_src_dir)
 run(["make", "install"], cwd=openresty_src_dir, use_sudo=True)
 
 # 13. Create GeoIP directory
-print("=== [13] Creating /etc/openresty/geoip directory ===")
+runner.begin_step("[13] Creating /etc/openresty/geoip directory")
 run(["mkdir", "-p", "/etc/openresty/geoip"], use_sudo=True)
 
 # 14. Download latest GeoLite2-Country.mmdb
-print("=== [14] Fetching latest GeoLite2 database URL ===")
+runner.begin_step("[14] Fetching latest GeoLite2 database URL", timeout=NETWORK_TIMEOUT)
 api_url = "https://api.github.com/repos/P3TERX/GeoLite.mmdb/releases/latest"
 api_response = run(["curl", "-s", api_url], capture_output=True)
 release_info = json.loads(api_response)
@@ -193,20 +195,24 @@ run([
 print("\n✅ All done! GeoLite2-Country.mmdb is installed in /etc/openresty/geoip/\n")
 
 # 14b
+runner.begin_step("[14b] Finalising installed scripts")
 run(["chmod", "+x", "/opt/automate_waf_rules.py"], use_sudo=True)
 run(["chmod", "+x", "/opt/country_mmdb.py"], use_sudo=True)
 run(["chmod", "+x", "/opt/clear_logs.py"], use_sudo=True)
 run(["chmod", "+x", "/opt/setup_cronjobs.py"], use_sudo=True)
+run(["chmod", "+x", "/opt/maintenance_scheduler.py"], use_sudo=True)
+run(["chmod", "+x", "/opt/fleet_rollout.py"], use_sudo=True)
 run(["chmod", "+x", "/var/log/400.py"], use_sudo=True)
 run(["chmod", "+x", "/var/log/403.py"], use_sudo=True)
 run(["chmod", "+x", "/var/log/alluri.py"], use_sudo=True)
+run(["chmod", "+x", "/var/log/audit_corpus.py"], use_sudo=True)
 
 # 14c
 run(["/usr/bin/python3", "/opt/setup_cronjobs.py"], use_sudo=True)
 
 
 # 15. Restart OpenResty
-print("=== [15] Restarting OpenResty ===")
+runner.begin_step("[15] Restarting OpenResty")
 run(["systemctl", "enable", "openresty"], use_sudo=True)
 run(["systemctl", "restart", "openresty"], use_sudo=True)
 run(["systemctl", "status", "openresty"], use_sudo=True)
@@ -219,5 +225,6 @@ run(["rm", "-rf", "/root/ngx_http_geoip2_module-master"], use_sudo=True)
 run(["chmod", "+x", "/root/delete_openresty_files.py"], use_sudo=True)
 run(["/usr/bin/python3", "/root/delete_openresty_files.py"], use_sudo=True)
 run(["rm", "-rf", "/root/delete_openresty_files.py"], use_sudo=True)
+run(["rm", "-rf", "/root/command_runner.py"], use_sudo=True)
 
 print("\n✅ All Done! ModSecurity WAF and GeoIP restrictions is now active with OpenResty.\n")